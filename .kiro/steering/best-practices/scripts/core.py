@@ -4,14 +4,34 @@ Best Practices Search Core - BM25 search engine for programming best practices.
 """
 
 import csv
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import pickle
 import re
+from array import array
 from pathlib import Path
 from math import log
-from collections import defaultdict
+from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # Optional: faster index.json parsing, stdlib json otherwise
+    _json_loads = json.loads
 
 # ============ CONFIGURATION ============
 DATA_DIR = Path(__file__).parent.parent / "data"
-CONTENT_DIR = Path(__file__).parent.parent.parent.parent.parent / "content"
+CACHE_DIR = DATA_DIR / ".cache"
+CACHE_VERSION = 8  # Bump when the pickled BM25 layout changes
+REPO_ROOT = Path(__file__).parent.parent.parent.parent.parent
+CONTENT_DIR = REPO_ROOT / "content"
+CONTENT_INDEX_FILE = CONTENT_DIR / ".bm25_index.pkl"
+CONTENT_CHARS = 3000  # Leading body characters of each content file used for search
 MAX_RESULTS = 5
 
 CSV_CONFIG = {
@@ -35,6 +55,8 @@ CSV_CONFIG = {
 
 # ============ BM25 IMPLEMENTATION ============
 
+_TOKEN_RE = re.compile(rb'[a-z0-9#+.]+')
+
 class BM25:
     """Okapi BM25 ranking function for text search."""
     
@@ -44,180 +66,362 @@ class BM25:
         self.doc_len = []
         self.avgdl = 0
         self.doc_freqs = []
-        self.idf = {}
         self.doc_count = 0
-        self.tokenized_docs = []
+        self.vocab = {}
+        self.idf_arr = []
+        self.len_norm = []
+        self.postings = []
     
-    def tokenize(self, text):
-        text = str(text).lower()
-        tokens = re.findall(r'[a-z0-9#+.]+', text)
-        return tokens
+    @staticmethod
+    def tokenize(text):
+        # Tokens are ASCII-only, so scan lowered UTF-8 bytes: bytes.lower()
+        # skips Unicode case mapping and bytes tokens hash cheaply. Unlike
+        # str.lower(), it leaves 'İ' (U+0130) and the Kelvin sign (U+212A)
+        # alone, so those no longer produce 'i' / 'k' tokens.
+        return _TOKEN_RE.findall(str(text).encode("utf-8", "replace").lower())
     
     def fit(self, documents):
-        self.doc_count = len(documents)
-        self.tokenized_docs = [self.tokenize(doc) for doc in documents]
-        self.doc_len = [len(doc) for doc in self.tokenized_docs]
+        # Only the per-document counts are kept; token lists are dropped as
+        # soon as they are counted.
+        self.fit_counts([Counter(self.tokenize(doc)) for doc in documents])
+    
+    def fit_counts(self, doc_counts):
+        """Fit from per-document {token: count} tables, skipping tokenization."""
+        self.doc_count = len(doc_counts)
+        self.doc_len = [sum(counts.values()) for counts in doc_counts]
         self.avgdl = sum(self.doc_len) / self.doc_count if self.doc_count else 1
         
-        df = defaultdict(int)
-        for doc in self.tokenized_docs:
-            unique_terms = set(doc)
-            for term in unique_terms:
-                df[term] += 1
+        # Intern tokens to dense int ids; everything past this point is
+        # indexed by token id rather than keyed by token.
+        vocab = self.vocab = {}
+        doc_term_freqs = [
+            {vocab.setdefault(term, len(vocab)): tf for term, tf in counts.items()}
+            for counts in doc_counts
+        ]
+        
+        # Everything except the IDF factor is query-independent, so each
+        # posting stores its saturated, length-normalised tf weight
+        # tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)) and scoring a
+        # query term reduces to a multiply-add per posting.
+        # avgdl is 0 only when every document is empty, so every dl is 0 too
+        avgdl = self.avgdl or 1
+        self.len_norm = array("f", [self.k1 * (1 - self.b + self.b * dl / avgdl) for dl in self.doc_len])
+        k1_plus_1 = self.k1 + 1
         
-        self.idf = {}
-        for term, freq in df.items():
-            self.idf[term] = log((self.doc_count - freq + 0.5) / (freq + 0.5) + 1)
+        # Postings, IDF and length norms are packed 4-byte int/float arrays
+        # rather than lists of Python objects; float32 is ample precision for
+        # scores reported to three decimals.
+        self.postings = [(array("i"), array("f")) for _ in range(len(vocab))]
+        for i, term_freqs in enumerate(doc_term_freqs):
+            norm = self.len_norm[i]
+            for term_id, tf in term_freqs.items():
+                doc_ids, weights = self.postings[term_id]
+                doc_ids.append(i)
+                weights.append(tf * k1_plus_1 / (tf + norm))
+        
+        self.idf_arr = array("f", [
+            log((self.doc_count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5) + 1)
+            for doc_ids, _ in self.postings
+        ])
     
     def score(self, query):
-        query_tokens = self.tokenize(query)
-        scores = []
-        for i, doc in enumerate(self.tokenized_docs):
-            score = 0
-            doc_len = self.doc_len[i]
-            term_freqs = defaultdict(int)
-            for term in doc:
-                term_freqs[term] += 1
-            
-            for token in query_tokens:
-                if token not in self.idf:
-                    continue
-                tf = term_freqs.get(token, 0)
-                idf = self.idf[token]
-                numerator = tf * (self.k1 + 1)
-                denominator = tf + self.k1 * (1 - self.b + self.b * doc_len / self.avgdl)
-                score += idf * numerator / denominator
-            
-            scores.append(score)
+        """Score every document; those without any query term score 0."""
+        scores = [0.0] * self.doc_count
+        for i, score in self.score_candidates(query).items():
+            scores[i] = score
         return scores
+    
+    def score_candidates(self, query):
+        """Return {doc_id: score} for only the documents containing a query term.
+        
+        Every other document scores 0, so ranking these candidates gives the
+        same top results as ranking the full score list.
+        """
+        query_term_ids = [
+            term_id for term_id in map(self.vocab.get, self.tokenize(query)) if term_id is not None
+        ]
+        scores = {}
+        for term_id in query_term_ids:
+            idf = self.idf_arr[term_id]
+            doc_ids, weights = self.postings[term_id]
+            for i, weight in zip(doc_ids, weights):
+                scores[i] = scores.get(i, 0.0) + idf * weight
+        return scores
+
+
+def _rank_key(candidate):
+    """heapq.nlargest key for (doc_id, score): higher score first, ties in document order."""
+    doc_id, score = candidate
+    return score, -doc_id
 
 
 # ============ SEARCH FUNCTIONS ============
 
 def _load_csv(filepath):
-    """Load CSV file and return list of dicts."""
+    """Load CSV file and return a {column: position} map and the rows as tuples."""
     with open(filepath, "r", encoding="utf-8") as f:
-        return list(csv.DictReader(f))
+        reader = csv.reader(f)
+        header = next(reader, [])
+        width = len(header)
+        rows = []
+        for row in reader:
+            if not row:
+                continue  # Blank line, skipped like csv.DictReader does
+            if len(row) < width:
+                row += [""] * (width - len(row))
+            rows.append(tuple(row))
+    return {name: i for i, name in enumerate(header)}, rows
 
 
-def _search_csv(filepath, search_cols, output_cols, query, max_results):
-    """Search a CSV file using BM25."""
-    rows = _load_csv(filepath)
-    if not rows:
-        return []
-    
-    documents = []
-    for row in rows:
-        doc_text = " ".join(str(row.get(col, "")) for col in search_cols)
-        documents.append(doc_text)
+def _fields_getter(indices):
+    """Return a function that picks the fields at indices from a row as a tuple."""
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda row: (row[index],)
+    if not indices:
+        return lambda row: ()
+    return itemgetter(*indices)
+
+
+def _load_index(filepath, mtime_ns, search_cols):
+    """Load CSV rows and their fitted BM25 index, reusing the on-disk cache when current."""
+    key = repr((CACHE_VERSION, filepath, search_cols)).encode("utf-8")
+    cache_file = CACHE_DIR / f"{hashlib.sha1(key).hexdigest()}.pkl"
+    try:
+        with open(cache_file, "rb") as f:
+            cached_mtime_ns, col_idx, rows, bm25 = pickle.load(f)
+        if cached_mtime_ns == mtime_ns:
+            return col_idx, rows, bm25
+    except Exception:
+        pass
     
+    col_idx, rows = _load_csv(filepath)
     bm25 = BM25()
-    bm25.fit(documents)
-    scores = bm25.score(query)
-    
-    ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)
-    results = []
-    for idx, score in ranked[:max_results]:
-        if score > 0:
-            result = {col: rows[idx].get(col, "") for col in output_cols if col in rows[idx]}
-            result["_score"] = round(score, 3)
-            results.append(result)
+    if rows:
+        search_fields = _fields_getter([col_idx[col] for col in search_cols if col in col_idx])
+        documents = []
+        for row in rows:
+            doc_text = " ".join(search_fields(row))
+            documents.append(doc_text)
+        bm25.fit(documents)
     
-    return results
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_file, "wb") as f:
+            pickle.dump((mtime_ns, col_idx, rows, bm25), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass  # Caching is best-effort; a read-only data dir just means refitting
+    return col_idx, rows, bm25
 
 
-def search(query, domain=None, max_results=MAX_RESULTS):
-    """Search best practices by domain or auto-detect."""
-    if domain and domain in CSV_CONFIG:
-        config = CSV_CONFIG[domain]
-    else:
-        domain = "resource"
-        config = CSV_CONFIG["resource"]
-    
-    filepath = DATA_DIR / config["file"]
+def _read_content_body(entry):
+    """Return the frontmatter-stripped search text of a content entry, or None if unreadable."""
+    filepath = REPO_ROOT / entry.get("file", "")
     if not filepath.exists():
-        return {"error": f"Data file not found: {filepath}. Run generate_csv.py first.", "query": query}
+        return None
+    try:
+        with open(filepath, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return ""
+            # Map the file rather than decoding all of it: only the pages
+            # holding the frontmatter and the leading body are touched.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = 0
+                # Remove frontmatter
+                if mm[:3] == b"---":
+                    end = mm.find(b"---", 3)
+                    if end != -1:
+                        start = end + 3
+                # UTF-8 needs at most 4 bytes per character, so this slice
+                # always decodes to at least CONTENT_CHARS characters.
+                body = mm[start:start + 4 * CONTENT_CHARS]
+    except Exception:
+        return None
+    return body.decode("utf-8", errors="replace")[:CONTENT_CHARS]
+
+
+def _count_content_tokens(entry):
+    """Return the {token: count} table of a content entry's search text, or None if unreadable."""
+    text = _read_content_body(entry)
+    if text is None:
+        return None
+    return dict(Counter(BM25.tokenize(text)))
+
+
+def build_content_index():
+    """Prebuild the content search index so search_content skips file I/O and refitting.
     
-    results = _search_csv(filepath, config["search_cols"], config["output_cols"], query, max_results)
+    Writes content/.bm25_index.pkl with every index.json entry, the token
+    counts of its stripped document text (None when unreadable) and a BM25
+    index fitted over all readable documents. Returns the number of indexed
+    documents.
+    """
+    index_file = CONTENT_DIR / "index.json"
+    mtime_ns = os.stat(index_file).st_mtime_ns
+    entries = list(_json_loads(index_file.read_bytes()).items())
     
-    return {
-        "domain": domain,
-        "query": query,
-        "file": config["file"],
-        "count": len(results),
-        "results": results,
+    doc_counts = [_count_content_tokens(entry) for _, entry in entries]
+    readable = [counts for counts in doc_counts if counts is not None]
+    bm25 = BM25()
+    if readable:
+        bm25.fit_counts(readable)
+    
+    content_index = {
+        "version": CACHE_VERSION,
+        "mtime_ns": mtime_ns,
+        "entries": entries,
+        "doc_counts": doc_counts,
+        "bm25": bm25,
     }
+    tmp_file = CONTENT_INDEX_FILE.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_file, "wb") as f:
+        pickle.dump(content_index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, CONTENT_INDEX_FILE)
+    return len(readable)
 
 
-def search_content(query, language=None, max_results=MAX_RESULTS):
-    """Search within crawled content files for deeper answers."""
-    import json
+def _load_content_index(mtime_ns):
+    """Return the prebuilt content index, or None if missing or not built from this index.json."""
+    try:
+        with open(CONTENT_INDEX_FILE, "rb") as f:
+            content_index = pickle.load(f)
+    except Exception:
+        return None
+    if content_index.get("version") != CACHE_VERSION or content_index.get("mtime_ns") != mtime_ns:
+        return None
+    return content_index
+
+
+class SearchSession:
+    """Entry point for searches that keeps loaded indexes in memory.
     
-    index_file = CONTENT_DIR / "index.json"
-    if not index_file.exists():
-        return {"error": "content/index.json not found. Run the crawler first.", "query": query}
-    
-    with open(index_file, "r", encoding="utf-8") as f:
-        index_data = json.load(f)
-    
-    # Filter by language if specified
-    entries = []
-    for rid, entry in index_data.items():
-        if language:
-            sub = entry.get("subcategory", "").lower()
-            cat = entry.get("category", "").lower()
-            title = entry.get("title", "").lower()
-            lang_lower = language.lower()
-            if lang_lower not in sub and lang_lower not in cat and lang_lower not in title:
-                continue
-        entries.append((rid, entry))
-    
-    if not entries:
-        return {"error": f"No content found for language: {language}", "query": query}
-    
-    # Build documents from content files
-    documents = []
-    valid_entries = []
-    for rid, entry in entries:
-        filepath = Path(__file__).parent.parent.parent.parent / entry.get("file", "")
+    Indexes are cached by file path and mtime, so one session can serve
+    several queries (e.g. --recommend) and still notices regenerated data.
+    """
+    
+    def __init__(self):
+        self._load_index = lru_cache(maxsize=8)(_load_index)
+        self._load_content_index = lru_cache(maxsize=8)(_load_content_index)
+    
+    def search(self, query, domain=None, max_results=MAX_RESULTS):
+        """Search best practices by domain or auto-detect."""
+        if domain and domain in CSV_CONFIG:
+            config = CSV_CONFIG[domain]
+        else:
+            domain = "resource"
+            config = CSV_CONFIG["resource"]
+        
+        filepath = DATA_DIR / config["file"]
         if not filepath.exists():
-            continue
-        try:
-            text = filepath.read_text(encoding="utf-8", errors="replace")
-            # Remove frontmatter
-            if text.startswith("---"):
-                end = text.find("---", 3)
-                if end != -1:
-                    text = text[end + 3:]
-            documents.append(text[:3000])  # First 3000 chars for search
-            valid_entries.append((rid, entry))
-        except Exception:
-            continue
-    
-    if not documents:
-        return {"error": "No readable content files found.", "query": query}
+            return {"error": f"Data file not found: {filepath}. Run generate_csv.py first.", "query": query}
+        
+        results = self._search_csv(filepath, config["search_cols"], config["output_cols"], query, max_results)
+        
+        return {
+            "domain": domain,
+            "query": query,
+            "file": config["file"],
+            "count": len(results),
+            "results": results,
+        }
     
-    bm25 = BM25()
-    bm25.fit(documents)
-    scores = bm25.score(query)
-    
-    ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)
-    results = []
-    for idx, score in ranked[:max_results]:
-        if score > 0:
-            rid, entry = valid_entries[idx]
-            results.append({
-                "Title": entry.get("title", ""),
-                "Category": entry.get("category", ""),
-                "URL": entry.get("url", ""),
-                "File": entry.get("file", ""),
-                "Relevance": round(score, 3),
-            })
-    
-    return {
-        "domain": "content",
-        "query": query,
-        "language": language,
-        "count": len(results),
-        "results": results,
-    }
+    def search_content(self, query, language=None, max_results=MAX_RESULTS):
+        """Search within crawled content files for deeper answers."""
+        index_file = CONTENT_DIR / "index.json"
+        if not index_file.exists():
+            return {"error": "content/index.json not found. Run the crawler first.", "query": query}
+        
+        content_index = self._load_content_index(os.stat(index_file).st_mtime_ns)
+        if content_index is not None:
+            entries = content_index["entries"]
+            doc_counts = content_index["doc_counts"]
+        else:
+            entries = list(_json_loads(index_file.read_bytes()).items())
+            doc_counts = None
+        
+        # Filter by language if specified
+        selected = []
+        for i, (rid, entry) in enumerate(entries):
+            if language:
+                sub = entry.get("subcategory", "").lower()
+                cat = entry.get("category", "").lower()
+                title = entry.get("title", "").lower()
+                lang_lower = language.lower()
+                if lang_lower not in sub and lang_lower not in cat and lang_lower not in title:
+                    continue
+            selected.append(i)
+        
+        if not selected:
+            return {"error": f"No content found for language: {language}", "query": query}
+        
+        # Tokenize content files unless their token counts were prebuilt
+        if doc_counts is None:
+            doc_counts = [None] * len(entries)
+            for i in selected:
+                doc_counts[i] = _count_content_tokens(entries[i][1])
+        valid = [i for i in selected if doc_counts[i] is not None]
+        
+        if not valid:
+            return {"error": "No readable content files found.", "query": query}
+        
+        if content_index is not None and not language:
+            bm25 = content_index["bm25"]
+        else:
+            bm25 = BM25()
+            bm25.fit_counts([doc_counts[i] for i in valid])
+        candidates = bm25.score_candidates(query)
+        
+        results = []
+        for idx, score in heapq.nlargest(max_results, candidates.items(), key=_rank_key):
+            if score > 0:
+                rid, entry = entries[valid[idx]]
+                results.append({
+                    "Title": entry.get("title", ""),
+                    "Category": entry.get("category", ""),
+                    "URL": entry.get("url", ""),
+                    "File": entry.get("file", ""),
+                    "Relevance": round(score, 3),
+                })
+        
+        return {
+            "domain": "content",
+            "query": query,
+            "language": language,
+            "count": len(results),
+            "results": results,
+        }
+    
+    def _search_csv(self, filepath, search_cols, output_cols, query, max_results):
+        """Search a CSV file using BM25."""
+        filepath = str(filepath)
+        col_idx, rows, bm25 = self._load_index(filepath, os.stat(filepath).st_mtime_ns, tuple(search_cols))
+        if not rows:
+            return []
+        
+        candidates = bm25.score_candidates(query)
+        output_names = [col for col in output_cols if col in col_idx]
+        output_fields = _fields_getter([col_idx[col] for col in output_names])
+        
+        results = []
+        for idx, score in heapq.nlargest(max_results, candidates.items(), key=_rank_key):
+            if score > 0:
+                result = dict(zip(output_names, output_fields(rows[idx])))
+                result["_score"] = round(score, 3)
+                results.append(result)
+        
+        return results
+
+
+_default_session = SearchSession()
+
+
+def search(query, domain=None, max_results=MAX_RESULTS):
+    """Search best practices by domain or auto-detect."""
+    return _default_session.search(query, domain, max_results)
+
+
+def search_content(query, language=None, max_results=MAX_RESULTS):
+    """Search within crawled content files for deeper answers."""
+    return _default_session.search_content(query, language, max_results)
@@ -6,14 +6,25 @@ Reads the crawled content and produces structured CSVs for BM25 search.
 
 import csv
 import json
+import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from core import build_content_index
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # Optional: faster index.json parsing, stdlib json otherwise
+    _json_loads = json.loads
+
 REPO_ROOT = Path(__file__).parent.parent.parent.parent.parent
 CONTENT_DIR = REPO_ROOT / "content"
 INDEX_FILE = CONTENT_DIR / "index.json"
 OUTPUT_DIR = Path(__file__).parent.parent / "data"
+PARALLEL_MIN_ENTRIES = 500  # Below this, worker start-up outweighs the parallel speedup
 
 
 def extract_frontmatter(filepath):
@@ -41,19 +52,61 @@ def extract_frontmatter(filepath):
     return meta, body
 
 
+_RE_IMG = re.compile(r'!\[.*?\]\(.*?\)')
+_RE_LINK = re.compile(r'\[([^\]]+)\]\([^\)]+\)')
+_RE_HTML = re.compile(r'<[^>]+>')
+_RE_HEAD = re.compile(r'^#{1,6}\s+', re.MULTILINE)
+_RE_RULE = re.compile(r'^---+$', re.MULTILINE)
+_RE_BLANKS = re.compile(r'\n{3,}')
+_RE_WORD = re.compile(r'\b[a-zA-Z#+.]{2,}\b')
+
+# Common language aliases
+_ALIASES = {
+    "javascript": ["js", "es6", "ecmascript", "node"],
+    "typescript": ["ts"],
+    "python": ["py", "django", "flask"],
+    "ruby": ["rb", "rails", "ror"],
+    "golang": ["go"],
+    "c++": ["cpp", "cplusplus"],
+    "c#": ["csharp", "dotnet"],
+    "objective-c": ["objc", "ios"],
+    "swift": ["ios", "macos"],
+    "react": ["reactjs", "jsx"],
+    "vue": ["vuejs"],
+    "angular": ["angularjs", "ng"],
+    "postgresql": ["postgres", "pg"],
+    "mysql": ["mariadb"],
+    "bash": ["shell", "sh", "zsh"],
+}
+
+_TECH_TERMS = [
+    "style guide", "best practices", "design patterns", "clean code",
+    "performance", "security", "testing", "debugging", "refactoring",
+    "architecture", "microservices", "api", "database", "sql",
+    "frontend", "backend", "fullstack", "devops", "ci/cd",
+    "docker", "kubernetes", "aws", "cloud", "serverless",
+    "rest", "graphql", "websocket", "authentication", "authorization",
+    "caching", "optimization", "scalability", "monitoring", "logging",
+]
+# One scan finds every term occurring in a snippet. The lookahead makes
+# matches zero-width so overlapping terms are all reported; no term is a
+# prefix of another, so each position yields at most one term.
+_TECH_RE = re.compile("(?=(%s))" % "|".join(map(re.escape, _TECH_TERMS)))
+
+
 def extract_summary(body, max_chars=500):
     """Extract a useful summary from markdown body."""
     # Remove markdown links, images, badges
-    text = re.sub(r'!\[.*?\]\(.*?\)', '', body)
-    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
+    text = _RE_IMG.sub('', body)
+    text = _RE_LINK.sub(r'\1', text)
     # Remove HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
+    text = _RE_HTML.sub('', text)
     # Remove markdown headers
-    text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
+    text = _RE_HEAD.sub('', text)
     # Remove horizontal rules
-    text = re.sub(r'^---+$', '', text, flags=re.MULTILINE)
+    text = _RE_RULE.sub('', text)
     # Remove excessive whitespace
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = _RE_BLANKS.sub('\n\n', text)
     text = text.strip()
     
     if len(text) > max_chars:
@@ -66,51 +119,21 @@ def extract_keywords(title, category, subcategory, body):
     keywords = set()
     
     # From title
-    for word in re.findall(r'\b[a-zA-Z#+.]{2,}\b', title):
+    for word in _RE_WORD.findall(title):
         keywords.add(word.lower())
     
     # From category/subcategory
-    for word in re.findall(r'\b[a-zA-Z#+.]{2,}\b', f"{category} {subcategory}"):
+    for word in _RE_WORD.findall(f"{category} {subcategory}"):
         keywords.add(word.lower())
     
-    # Common language aliases
-    aliases = {
-        "javascript": ["js", "es6", "ecmascript", "node"],
-        "typescript": ["ts"],
-        "python": ["py", "django", "flask"],
-        "ruby": ["rb", "rails", "ror"],
-        "golang": ["go"],
-        "c++": ["cpp", "cplusplus"],
-        "c#": ["csharp", "dotnet"],
-        "objective-c": ["objc", "ios"],
-        "swift": ["ios", "macos"],
-        "react": ["reactjs", "jsx"],
-        "vue": ["vuejs"],
-        "angular": ["angularjs", "ng"],
-        "postgresql": ["postgres", "pg"],
-        "mysql": ["mariadb"],
-        "bash": ["shell", "sh", "zsh"],
-    }
-    
-    for lang, alts in aliases.items():
+    for lang, alts in _ALIASES.items():
         if lang in keywords or any(a in keywords for a in alts):
             keywords.add(lang)
             keywords.update(alts)
     
     # Extract from first 2000 chars of body for topic keywords
     snippet = body[:2000].lower()
-    tech_terms = [
-        "style guide", "best practices", "design patterns", "clean code",
-        "performance", "security", "testing", "debugging", "refactoring",
-        "architecture", "microservices", "api", "database", "sql",
-        "frontend", "backend", "fullstack", "devops", "ci/cd",
-        "docker", "kubernetes", "aws", "cloud", "serverless",
-        "rest", "graphql", "websocket", "authentication", "authorization",
-        "caching", "optimization", "scalability", "monitoring", "logging",
-    ]
-    for term in tech_terms:
-        if term in snippet:
-            keywords.add(term)
+    keywords.update(_TECH_RE.findall(snippet))
     
     return ", ".join(sorted(keywords))
 
@@ -156,54 +179,72 @@ LANGUAGE_MAP = {
     "AWS Best Practices": {"language": "AWS", "domain": "cloud"},
     "Microservices & Cloud-Native Best Practices": {"language": "Microservices", "domain": "cloud"},
 }
+# Subcategory casing drifts between crawls, so look it up case-insensitively
+_LANGUAGE_MAP_LC = {subcategory.lower(): info for subcategory, info in LANGUAGE_MAP.items()}
+
+
+# Source authority, matched against the lowercased resource URL
+_AUTH_INDUSTRY = re.compile(r'google\.|airbnb|uber|microsoft|mozilla|shopify')
+_AUTH_STANDARD = re.compile(r'owasp|12factor|refactoring\.guru')
+
+
+def _process_entry(item):
+    """Build the resources.csv row for one (rid, entry) pair, or None if its file is missing."""
+    rid, entry = item
+    filepath = REPO_ROOT / entry.get("file", "")
+    if not filepath.exists():
+        return None
+    
+    fm, body = extract_frontmatter(filepath)
+    title = entry.get("title", "")
+    category = entry.get("category", "")
+    subcategory = entry.get("subcategory", "")
+    url = entry.get("url", "")
+    
+    # Determine language/tech
+    lang_info = _LANGUAGE_MAP_LC.get(subcategory.lower(), {})
+    language = lang_info.get("language", category)
+    domain = lang_info.get("domain", "general")
+    
+    keywords = extract_keywords(title, category, subcategory, body)
+    summary = extract_summary(body)
+    
+    # Determine source authority
+    authority = "community"
+    url_lower = url.lower()
+    if _AUTH_INDUSTRY.search(url_lower):
+        authority = "industry-leader"
+    elif "github.com" in url_lower:
+        authority = "open-source"
+    elif _AUTH_STANDARD.search(url_lower):
+        authority = "standard"
+    
+    return {
+        "ID": rid,
+        "Title": title,
+        "Language": language,
+        "Domain": domain,
+        "Category": category,
+        "Subcategory": subcategory,
+        "Authority": authority,
+        "URL": url,
+        "Keywords": keywords,
+        "Summary": summary,
+    }
 
 
 def generate_resources_csv(index_data):
     """Generate the main resources.csv with all crawled content."""
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     
-    rows = []
-    for rid, entry in index_data.items():
-        filepath = REPO_ROOT / entry.get("file", "")
-        if not filepath.exists():
-            continue
-        
-        fm, body = extract_frontmatter(filepath)
-        title = entry.get("title", "")
-        category = entry.get("category", "")
-        subcategory = entry.get("subcategory", "")
-        url = entry.get("url", "")
-        
-        # Determine language/tech
-        lang_info = LANGUAGE_MAP.get(subcategory, {})
-        language = lang_info.get("language", category)
-        domain = lang_info.get("domain", "general")
-        
-        keywords = extract_keywords(title, category, subcategory, body)
-        summary = extract_summary(body)
-        
-        # Determine source authority
-        authority = "community"
-        url_lower = url.lower()
-        if any(org in url_lower for org in ["google.", "airbnb", "uber", "microsoft", "mozilla", "shopify"]):
-            authority = "industry-leader"
-        elif "github.com" in url_lower:
-            authority = "open-source"
-        elif any(org in url_lower for org in ["owasp", "12factor", "refactoring.guru"]):
-            authority = "standard"
-        
-        rows.append({
-            "ID": rid,
-            "Title": title,
-            "Language": language,
-            "Domain": domain,
-            "Category": category,
-            "Subcategory": subcategory,
-            "Authority": authority,
-            "URL": url,
-            "Keywords": keywords,
-            "Summary": summary,
-        })
+    # Each entry is independent file I/O plus regex work, so fan out across
+    # processes when there are several cores and enough entries to pay for
+    # starting the workers; map() keeps rows in index.json order.
+    if (os.cpu_count() or 1) > 1 and len(index_data) >= PARALLEL_MIN_ENTRIES:
+        with ProcessPoolExecutor() as executor:
+            rows = [row for row in executor.map(_process_entry, index_data.items(), chunksize=32) if row is not None]
+    else:
+        rows = [row for row in map(_process_entry, index_data.items()) if row is not None]
     
     outfile = OUTPUT_DIR / "resources.csv"
     fieldnames = ["ID", "Title", "Language", "Domain", "Category", "Subcategory", "Authority", "URL", "Keywords", "Summary"]
@@ -299,13 +340,13 @@ def main():
         print(f"Error: {INDEX_FILE} not found. Run the crawler first.")
         sys.exit(1)
     
-    with open(INDEX_FILE, "r", encoding="utf-8") as f:
-        index_data = json.load(f)
+    index_data = _json_loads(INDEX_FILE.read_bytes())
     
     print(f"Generating CSV databases from {len(index_data)} resources...")
     resources = generate_resources_csv(index_data)
     generate_languages_csv(resources)
     generate_categories_csv(resources)
+    print(f"  ✓ content/.bm25_index.pkl: {build_content_index()} documents")
     print(f"\nDone! CSV files written to {OUTPUT_DIR}")
 
 
@@ -15,7 +15,7 @@ Usage:
 import argparse
 import sys
 import io
-from core import CSV_CONFIG, MAX_RESULTS, search, search_content
+from core import CSV_CONFIG, MAX_RESULTS, SearchSession
 
 # Force UTF-8
 if sys.stdout.encoding and sys.stdout.encoding.lower() != 'utf-8':
@@ -103,21 +103,22 @@ if __name__ == "__main__":
     parser.add_argument("--recommend", "-r", action="store_true", help="Get full recommendation (resources + content)")
 
     args = parser.parse_args()
+    session = SearchSession()
 
     if args.recommend:
         # Full recommendation: search resources + content
-        resource_results = search(args.query, "resource", args.max_results)
-        content_results = search_content(args.query, args.lang, 3)
+        resource_results = session.search(args.query, "resource", args.max_results)
+        content_results = session.search_content(args.query, args.lang, 3)
         print(format_recommendation(args.query, resource_results, content_results))
     elif args.content:
-        result = search_content(args.query, args.lang, args.max_results)
+        result = session.search_content(args.query, args.lang, args.max_results)
         if args.json:
             import json
             print(json.dumps(result, indent=2, ensure_ascii=False))
         else:
             print(format_output(result))
     else:
-        result = search(args.query, args.domain, args.max_results)
+        result = session.search(args.query, args.domain, args.max_results)
         if args.json:
             import json
             print(json.dumps(result, indent=2, ensure_ascii=False))